@@ -1,3 +1,6 @@
+import os
+from functools import lru_cache
+
 # Imports for creating a json-definition
 try:
     from typing import Iterable, List, Literal, Union
@@ -15,6 +18,18 @@ from litex.soc.integration.soc import SoC
 from litex.soc.integration.doc import AutoDoc, ModuleDoc
 from litex.build.generic_platform import *
 
+# The public interface of this module; star-imports above drag in the whole
+# Migen/LiteX namespace, so an explicit export list also lets static analysis
+# flag accidental imports.
+__all__ = [
+    "StepGenPinoutStepDirBaseConfig",
+    "StepGenPinoutStepDirConfig",
+    "StepGenPinoutStepDirDifferentialConfig",
+    "StepgenConfig",
+    "StepgenModule",
+    "StepgenModuleBresenham",
+]
+
 
 class StepGenPinoutStepDirBaseConfig(BaseModel):
 
@@ -25,7 +40,6 @@ class StepGenPinoutStepDirBaseConfig(BaseModel):
         """
 
         # Output parameters
-        generator.step_prev = Signal()
         generator.step = Signal()
         generator.dir = Signal(reset=True)
 
@@ -36,73 +50,139 @@ class StepGenPinoutStepDirBaseConfig(BaseModel):
         generator.steplen = Signal(10)
         generator.dir_hold_time = Signal(10)
         generator.dir_setup_time = Signal(12)
-        # - counters
-        generator.steplen_counter = StepgenCounter(10)
-        generator.dir_hold_counter = StepgenCounter(11)
-        generator.dir_setup_counter = StepgenCounter(13)
-        generator.submodules += [
-            generator.steplen_counter,
-            generator.dir_hold_counter,
-            generator.dir_setup_counter
-        ]
+        # - down-counters for the three timing windows. The windows cannot be
+        #   fused into a single timeline: the step window must restart on
+        #   every accepted step, also while the (longer) dir windows are still
+        #   running, otherwise steps are dropped whenever the step period is
+        #   shorter than steplen + dir_hold_time + dir_setup_time. The
+        #   counters are sized to their maximum reload value instead of the
+        #   32 bits the former counter submodules used.
+        generator.steplen_counter = Signal(10)
+        generator.dir_hold_counter = Signal(11)
+        generator.dir_setup_counter = Signal(13)
         generator.hold_dds = Signal()
 
+        # Reload values for the two direction windows. The sums are computed
+        # once in combinational signals instead of being inlined in every
+        # reload below: synthesis would CSE the duplicated adders anyway, but
+        # the Migen simulator evaluates every inlined add per cycle.
+        dir_hold_end = Signal(11)
+        dir_setup_end = Signal(13)
+        generator.comb += [
+            dir_hold_end.eq(generator.steplen + generator.dir_hold_time),
+            dir_setup_end.eq(dir_hold_end + generator.dir_setup_time),
+        ]
+
+        # Single-bit flags for the conditions used below. Precomputing them
+        # keeps the critical path short: each flag is one comparator fed
+        # straight from a registered counter, and the register enables
+        # reduce to an AND of these bits instead of a chain of wide
+        # comparators behind the direction XOR.
+        generator.dir_changed = Signal()
+        generator.step_active = Signal()
+        generator.dir_hold_expired = Signal()
+        generator.dir_setup_expired = Signal()
+        generator.comb += [
+            generator.dir_changed.eq(
+                generator.dir != generator.speed_sign
+            ),
+            generator.step_active.eq(
+                generator.steplen_counter != 0
+            ),
+            generator.dir_hold_expired.eq(
+                generator.dir_hold_counter == 0
+            ),
+            generator.dir_setup_expired.eq(
+                generator.dir_setup_counter == 0
+            ),
+        ]
+
         # Translate the position to steps by looking at the n'th bit (pick-off)
         # NOTE: to be able to simply add the velocity to the position for every timestep, the position
         # registered is widened from the default 64-buit width to 64-bit + difference in pick-off for
         # position and velocity. This meands that the bit we have to watch is also shifted by the
         # same amount. This means that although we are watching the position, we have to use the pick-off
-        # for velocity
+        # for velocity (corrected for pruned bits, see `pick_off_step`)
+        # The pending step is detected with a single XOR against the bit at
+        # the last accepted step. NOTE: `step_bit_d` is deliberately only
+        # updated when the step is accepted (not every cycle): during a
+        # hold_dds period the pending edge must stay visible, so the step is
+        # emitted once the hold lapses.
+        generator.step_bit = Signal()
+        generator.step_bit_d = Signal()
+        generator.step_edge = Signal()
+        generator.comb += [
+            generator.step_bit.eq(generator.position[generator.pick_off_step]),
+            generator.step_edge.eq(generator.step_bit ^ generator.step_bit_d),
+        ]
         generator.sync += If(
-            generator.position[generator.pick_off_vel] != generator.step_prev,
+            generator.step_edge,
             # Corner-case: The machine is at rest and starts to move in the opposite
             # direction. Wait with stepping the machine until the dir setup time has
             # passed.
             If(
                 ~generator.hold_dds,
                 # The relevant bit has toggled, make a step to the next position by
-                # resetting the counters
-                generator.step_prev.eq(generator.position[generator.pick_off_vel]),
-                generator.steplen_counter.counter.eq(generator.steplen),
-                generator.dir_hold_counter.counter.eq(generator.steplen + generator.dir_hold_time),
-                generator.dir_setup_counter.counter.eq(generator.steplen + generator.dir_hold_time + generator.dir_setup_time),
+                # reloading the counters
+                generator.step_bit_d.eq(generator.step_bit),
+                generator.steplen_counter.eq(generator.steplen),
+                generator.dir_hold_counter.eq(dir_hold_end),
+                generator.dir_setup_counter.eq(dir_setup_end),
                 generator.wait.eq(False)
             ).Else(
                 generator.wait.eq(True)
             )
         )
-        # Reset the DDS flag when dir_setup_counter has lapsed
+        # Reset the DDS flag when the dir_setup window has lapsed
         generator.sync += If(
-            generator.dir_setup_counter.counter == 0,
+            generator.dir_setup_expired,
             generator.hold_dds.eq(0)
         )
 
         # Convert the parameters to output of step and dir
         # - step
         generator.sync += If(
-            generator.steplen_counter.counter > 0,
+            generator.step_active,
             generator.step.eq(1)
         ).Else(
             generator.step.eq(0)
         )
         # - dir
         generator.sync += If(
-            generator.dir != (generator.speed[32 + (generator.pick_off_acc - generator.pick_off_vel) - 1]),
+            generator.dir_changed,
             # Enable the Hold DDS, but wait with changing the dir pin until the
-            # dir_hold_counter has been elapsed
+            # dir_hold window has been elapsed
             generator.hold_dds.eq(1),
             # Corner-case: The machine is at rest and starts to move in the opposite
             # direction. In this case the dir pin is toggled, while a step can follow
             # suite. We wait in this case the minimum dir_setup_time
             If(
-                generator.dir_setup_counter.counter == 0,
-                generator.dir_setup_counter.counter.eq(generator.dir_setup_time)
+                generator.dir_setup_expired,
+                generator.dir_setup_counter.eq(generator.dir_setup_time)
             ),
             If(
-                generator.dir_hold_counter.counter == 0,
-                generator.dir.eq(generator.speed[32 + (generator.pick_off_acc - generator.pick_off_vel) - 1])
+                generator.dir_hold_expired,
+                generator.dir.eq(generator.speed_sign)
             )
         )
+        # - the count-downs. These statements are deliberately the last
+        #   synchronous statements of this routine: Migen resolves multiple
+        #   assignments in the same cycle in favour of the last one, so on a
+        #   simultaneous reload and decrement the decrement wins and a
+        #   counter which is still running is never extended (the behaviour
+        #   the counters had as submodules, whose synchronous statements
+        #   Migen appends after the parent's).
+        generator.sync += [
+            If(
+                counter != 0,
+                counter.eq(counter - 1)
+            )
+            for counter in (
+                generator.steplen_counter,
+                generator.dir_hold_counter,
+                generator.dir_setup_counter,
+            )
+        ]
 
         # Create the outputs
         generator.ios = {generator.step, generator.dir}
@@ -199,6 +279,21 @@ class StepGenPinoutStepDirDifferentialConfig(StepGenPinoutStepDirBaseConfig):
             pads.dir_neg.eq(~generator.dir),
         ]
 
+@lru_cache(maxsize=None)
+def _build_pin_extension(index, pins_json, pins_cls):
+    """
+    Builds the platform extension for a stepgen. Cached on the (frozen) pin
+    configuration: repeated builds with the same configuration — notably
+    iterative simulation and firmware builds in the same process — re-use
+    the constructed Subsignal/Pins objects instead of re-parsing the config
+    and re-allocating them.
+    """
+    return (
+        "stepgen", index,
+        *pins_cls.parse_raw(pins_json).convert_to_signal()
+    )
+
+
 class StepgenConfig(BaseModel):
     pins: Union[
             StepGenPinoutStepDirConfig, 
@@ -216,34 +311,38 @@ class StepgenConfig(BaseModel):
         "disabled. When True, the stepgen will stop the machine with respect to the "
         "acceleration limits and then be disabled. Default value: False."
     )
-
-
-class StepgenCounter(Module, AutoDoc):
-
-    def __init__(self, size=32) -> None:
-
-        self.intro = ModuleDoc("""
-        Simple counter which counts down as soon as the Signal
-        `counter` has a value larger then 0. Designed for the
-        several timing components of the StepgenModule.
-        """)
-
-        # Create a 32 bit counter which counts down
-        self.counter = Signal(size)
-        self.sync += If(
-            self.counter > 0,
-            self.counter.eq(self.counter - 1)
-        )
+    prune_bits: int = Field(
+        0,
+        description="The number of least-significant bits pruned from the position "
+        "accumulator. Bits below the position pick-off only carry sub-step "
+        "resolution; pruning them shortens the carry chain of the position adder "
+        "(higher obtainable clock frequency, fewer registers) at the cost of "
+        "sub-step rounding in the step timing. Default value: 0 (exact)."
+    )
 
 
 class StepgenModule(Module, AutoDoc):
 
-    def __init__(self, pads, pick_off, soft_stop, create_routine) -> None:
+    def __init__(self, pads, pick_off, soft_stop, create_routine,
+                 position_width=64, speed_width=32, prune_bits=0) -> None:
         """
-        
+
         NOTE: pickoff should be a three-tuple. A different pick-off for position, speed
         and acceleration is supported. When pick-off is a integer, all the pick offs will
         be the same.
+
+        The width of the position accumulator and the speed registers can be
+        reduced with `position_width` and `speed_width` when the pick-off and
+        the step rates do not exercise the upper bits; a narrower accumulator
+        means a shorter carry chain (higher Fmax, fewer LUTs). The defaults
+        keep the original 64/32 bit layout.
+
+        With `prune_bits` the lowest bits of the position accumulator are
+        dropped altogether: the bits below the position pick-off only carry
+        sub-step resolution, so pruning them trades a little rounding in the
+        step timing for an even shorter carry chain. The amount is limited
+        to the gap between the velocity and position pick-off, so the
+        position feedback is unaffected.
         """
 
         self.intro = ModuleDoc("""
@@ -292,9 +391,27 @@ class StepgenModule(Module, AutoDoc):
         else:
             raise ValueError("`pick_off` must be either a list of pick_offs or a single integer value." )
 
+        # Precompute the pick-off deltas: these width offsets are used in
+        # nearly every signal definition and slice below, so they are
+        # evaluated once instead of being re-derived at every use site
+        self.d_av = self.pick_off_acc - self.pick_off_vel
+        self.d_vp = self.pick_off_vel - self.pick_off_pos
+
+        if not 0 <= prune_bits <= self.d_vp:
+            raise ValueError(
+                f"`prune_bits` ({prune_bits}) must be between 0 and the gap between "
+                f"the velocity and position pick-off ({self.d_vp})."
+            )
+
         # Calculate constants based on the pick-off
         # - speed_reset_val: 0x8000_0000 in case of 32-bit variable, otherwise increase to set the sign bit
-        self.speed_reset_val = (0x8000_0000 << (self.pick_off_acc - self.pick_off_vel)) 
+        self.position_width = position_width
+        self.speed_width = speed_width
+        self.prune_bits = prune_bits
+        # The bit of the (possibly pruned) position register which toggles
+        # once per half step-period
+        self.pick_off_step = self.pick_off_vel - prune_bits
+        self.speed_reset_val = (1 << (speed_width - 1)) << self.d_av
 
         # Values which determine the spacing of the step. These
         # are used to reset the counters.
@@ -304,24 +421,88 @@ class StepgenModule(Module, AutoDoc):
 
         # Main parameters for position, speed and acceleration
         self.enable = Signal()
-        self.position = Signal(64 + (self.pick_off_vel - self.pick_off_pos))
+        self.position = Signal(position_width + self.d_vp - prune_bits)
         self.speed = Signal(
-            32 + (self.pick_off_acc - self.pick_off_vel),
+            speed_width + self.d_av,
             reset=self.speed_reset_val
         )
         self.speed_target = Signal(
-            32 + (self.pick_off_acc - self.pick_off_vel),
+            speed_width + self.d_av,
             reset=self.speed_reset_val
         )
         self.max_acceleration = Signal(32)
+        # Registered copy of the sign bit (MSB) of the speed. The MSB of the
+        # wide speed register fans out to the direction logic; a dedicated
+        # one-bit register tapped from the selected next speed keeps that a
+        # short single-bit net. The reset value matches `dir` (set means
+        # moving in positive direction).
+        self.speed_sign = Signal(reset=1)
 
+        # Difference between the target speed and the actual speed. Computing
+        # the (signed) difference once means the acceleration limit check
+        # needs a single subtractor feeding two comparators, instead of two
+        # add-then-compare chains.
+        self.speed_delta = Signal((speed_width + self.d_av + 1, True))
+        self.comb += self.speed_delta.eq(self.speed_target - self.speed)
+        # Flag indicating whether an acceleration limit is configured at all.
+        # Hoisted out of the speed update so the simulator short-circuits the
+        # comparators below when the limit is disabled and synthesis can prune
+        # them per instance.
+        self.accel_enabled = Signal()
+        self.comb += self.accel_enabled.eq(self.max_acceleration != 0)
 
         # Optionally, use a different clock domain
         sync = self.sync
 
+        # The magnitude of the difference, so the acceleration limit check
+        # is a single comparator with the sign selecting between adding and
+        # subtracting the limit, instead of two comparators with separate
+        # accelerate/decelerate branches
+        delta_sign = self.speed_delta[len(self.speed_delta) - 1]
+        self.abs_delta = Signal(len(self.speed_delta))
+        self.comb += self.abs_delta.eq(
+            Mux(delta_sign, -self.speed_delta, self.speed_delta)
+        )
+
+        # The outcome of the wide comparison against the acceleration limit
+        # is registered one cycle ahead of the speed update, so the
+        # subtract-and-compare no longer feeds the speed register in the same
+        # cycle (roughly halving the combinational depth of this path). The
+        # decision thus lags the speed by one cycle: at the end of a ramp the
+        # speed can pass the target by less than one max_acceleration for a
+        # single cycle before it snaps to the target. A freshly written
+        # speed_target is guarded with speed_target_stable below, so the
+        # snap can never bypass a whole ramp.
+        self.accel_limited = Signal()
+        self.delta_sign = Signal()
+        self.speed_target_d = Signal.like(self.speed_target)
+        self.speed_target_stable = Signal()
+        sync += [
+            self.accel_limited.eq(self.abs_delta > self.max_acceleration),
+            self.delta_sign.eq(delta_sign),
+            self.speed_target_d.eq(self.speed_target),
+        ]
+        self.comb += self.speed_target_stable.eq(
+            self.speed_target == self.speed_target_d
+        )
+        # The signed step applied while the limit is active: the
+        # acceleration with the sign of the (registered) difference
+        self.accel_step = Signal((len(self.max_acceleration) + 1, True))
+        self.comb += self.accel_step.eq(
+            Mux(self.delta_sign, -self.max_acceleration, self.max_acceleration)
+        )
+        # The speed after one acceleration step, hoisted into a named signal
+        # so the adder appears once instead of once per consumer (the speed
+        # register and the sign-bit tap)
+        self.speed_stepped = Signal.like(self.speed)
+        self.comb += self.speed_stepped.eq(self.speed + self.accel_step)
+
         # Determine the next speed, while taking into account acceleration limits if
         # applied. The speed is not updated when the direction has changed and we are
         # still waiting for the dir_setup to time out.
+        # The sign bit of the speed; `speed_sign` is updated from the same
+        # (selected) next value wherever the speed itself is assigned
+        sign_bit = len(self.speed) - 1
         sync += If(
             ~self.reset & ~self.wait,
             # When the machine is not enabled, the speed is clamped to 0. This results in a
@@ -332,31 +513,29 @@ class StepgenModule(Module, AutoDoc):
                 self.speed_target.eq(self.speed_reset_val)
             ),
             If(
-                self.max_acceleration == 0,
+                ~self.accel_enabled,
                 # Case: no maximum acceleration defined, directly apply the requested speed
-                self.speed.eq(self.speed_target)
+                self.speed.eq(self.speed_target),
+                self.speed_sign.eq(self.speed_target[sign_bit])
             ).Else(
-                # Case: obey the maximum acceleration / deceleration
                 If(
-                    # Accelerate, difference between actual speed and target speed is too
-                    # large to bridge within one clock-cycle
-                    self.speed_target > (self.speed + self.max_acceleration),
+                    # The difference between actual speed and target speed is too
+                    # large to bridge within one clock-cycle: move towards the
+                    # target by the (signed) acceleration step.
                     # The counters are again a fixed point arithmetric. Every loop we keep
                     # the fraction and add the integer part to the speed. The fraction is
                     # used as a starting point for the next loop.
-                    self.speed.eq(self.speed + self.max_acceleration),
+                    self.accel_limited,
+                    self.speed.eq(self.speed_stepped),
+                    self.speed_sign.eq(self.speed_stepped[sign_bit])
                 ).Elif(
-                    # Decelerate, difference between actual speed and target speed is too
-                    # large to bridge within one clock-cycle
-                    self.speed_target < (self.speed - self.max_acceleration),
-                    # The counters are again a fixed point arithmetric. Every loop we keep
-                    # the fraction and add the integer part to the speed. However, we have
-                    # keep in mind we are subtracting now every loop
-                    self.speed.eq(self.speed - self.max_acceleration)
-                ).Else(
-                    # Small difference between speed and target speed, gap can be bridged within
-                    # one clock cycle.
-                    self.speed.eq(self.speed_target)
+                    # Small difference between speed and target speed, gap can be bridged
+                    # within one clock cycle. Only snap when the registered decision was
+                    # based on the current target; a target written this very cycle takes
+                    # effect one cycle later.
+                    self.speed_target_stable,
+                    self.speed.eq(self.speed_target),
+                    self.speed_sign.eq(self.speed_target[sign_bit])
                 )
             )
         )
@@ -370,28 +549,173 @@ class StepgenModule(Module, AutoDoc):
             # Reset speed and position to 0
             self.speed_target.eq(self.speed_reset_val),
             self.speed.eq(self.speed_reset_val),
+            self.speed_sign.eq(1),
             self.max_acceleration.eq(0),
-            self.position.eq(0),
+            # NOTE: the position is cleared by `_add_position_update`, which
+            # owns the state backing the position
         )
 
         # Update the position
+        self._add_position_update(sync, soft_stop)
+
+        # Create the routine which actually handles the steps
+        create_routine(self, pads)
+
+    def _add_position_update(self, sync, soft_stop) -> None:
+        """
+        Adds the statements which update the position from the speed. Split
+        in a separate method so sub-classes can implement a different
+        position/step generation scheme (see `StepgenModuleBresenham`).
+
+        The position is kept as a DDS phase accumulator spanning one full
+        step-period plus a signed counter of whole periods: the per-cycle adder
+        then only spans the phase (`pick_off_step + 1` bits) instead of the
+        whole position register, and the wide upper half is a plain +/-1
+        counter which only changes on a step. Concatenated they equal the
+        original single wide accumulator bit for bit, so the position
+        feedback and the step pick-off are unaffected.
+
+        NOTE: this supersedes splitting the wide accumulator in two halves
+        with a registered carry in between: the upper half is not part of
+        the per-cycle carry chain at all here, and the feedback does not
+        lag (a carry-save split would delay the upper half of the position
+        by a cycle).
+        """
+        # The pruned bits are dropped from the speed as well, so the adder
+        # matches the width of the (possibly pruned) phase accumulator
+        velocity = Signal((self.speed_width - self.prune_bits + 1, True))
+        self.comb += velocity.eq(
+            self.speed[self.d_av + self.prune_bits:]
+            - (1 << (self.speed_width - 1 - self.prune_bits))
+        )
+        phase_bits = self.pick_off_step + 1
+        self.phase = Signal(phase_bits)
+        self.step_counter = Signal((len(self.position) - phase_bits, True))
+        # Extended sum with room for the carry and the sign, so a single
+        # slice/bit-test splits it in the next phase and the counter update
+        phase_next = Signal((phase_bits + 2, True))
+        self.comb += [
+            phase_next.eq(self.phase + velocity),
+            self.position.eq(Cat(self.phase, self.step_counter)),
+        ]
         if soft_stop:
-            sync += If(
-                # Only check we are not waiting for the dir_setup. When the system is disabled, the
-                # speed is set to 0 (with respect to acceleration limits) and the machine will be
-                # stopped when disabled.
-                ~self.reset & ~self.wait,
-                self.position.eq(self.position + self.speed[(self.pick_off_acc - self.pick_off_vel):] - 0x8000_0000)
-            )
+            # Only check we are not waiting for the dir_setup. When the system is disabled, the
+            # speed is set to 0 (with respect to acceleration limits) and the machine will be
+            # stopped when disabled.
+            gate = ~self.reset & ~self.wait
         else:
-            sync += If(
-                # Check whether the system is enabled and we are not waiting for the dir_setup
-                ~self.reset & self.enable & ~self.wait,
-                self.position.eq(self.position + self.speed[(self.pick_off_acc - self.pick_off_vel):] - 0x8000_0000)
+            # Check whether the system is enabled and we are not waiting for the dir_setup
+            gate = ~self.reset & self.enable & ~self.wait
+        sync += If(
+            gate,
+            self.phase.eq(phase_next[:phase_bits]),
+            If(
+                # The extended sum is negative: the phase wrapped backwards
+                phase_next[phase_bits + 1],
+                self.step_counter.eq(self.step_counter - 1)
+            ).Elif(
+                # Carry out of the phase: the phase wrapped forwards
+                phase_next[phase_bits],
+                self.step_counter.eq(self.step_counter + 1)
             )
+        )
+        sync += If(
+            self.reset,
+            self.phase.eq(0),
+            self.step_counter.eq(0)
+        )
 
-        # Create the routine which actually handles the steps
-        create_routine(self, pads)
+    @classmethod
+    def generate_verilog(cls, pins, pick_off, soft_stop,
+                         position_width=64, speed_width=32, prune_bits=0,
+                         cache_dir=None):
+        """
+        Returns the path to the generated Verilog for the given
+        parameterization. The output is cached on disk keyed on the
+        parameters: multi-axis boards instantiate several stepgens with the
+        same pick-off, and repeated conversions (e.g. between simulation
+        runs) would otherwise re-run the whole Migen elaboration for an
+        identical result.
+        """
+        import hashlib
+
+        if cache_dir is None:
+            cache_dir = os.path.join(
+                os.path.expanduser("~"), ".cache", "litexcnc"
+            )
+        # The names of the exported ports, in this order. They are part of
+        # the cache key: consumers bind the ports by name, so a cached
+        # artifact from an older naming scheme must be regenerated instead
+        # of reused.
+        port_names = (
+            "enable",
+            "speed_target",
+            "max_acceleration",
+            "steplen",
+            "dir_hold_time",
+            "dir_setup_time",
+            "position",
+            "speed",
+            "step",
+            "dir",
+        )
+        key = hashlib.sha256(
+            repr((
+                pins.json(),
+                pick_off,
+                soft_stop,
+                position_width,
+                speed_width,
+                prune_bits,
+                port_names
+            )).encode()
+        ).hexdigest()[:16]
+        path = os.path.join(cache_dir, f"stepgen_{key}.v")
+        if not os.path.exists(path):
+            from migen.fhdl import verilog
+            stepgen = cls(
+                pads=None,
+                pick_off=pick_off,
+                soft_stop=soft_stop,
+                create_routine=pins.create_routine,
+                position_width=position_width,
+                speed_width=speed_width,
+                prune_bits=prune_bits
+            )
+            # `speed_target` and `max_acceleration` are registers which the
+            # stepgen itself also writes (the disable clamp and the reset),
+            # so a bare conversion would turn them into output ports which
+            # no consumer of the Verilog could drive. Wrap the stepgen in a
+            # harness which latches them from real input ports every cycle,
+            # like the SoC integration latches them from the CSRs; on a
+            # simultaneous write the statements of the stepgen win, as they
+            # do in the SoC.
+            standalone = Module()
+            standalone.submodules.stepgen = stepgen
+            speed_target = Signal.like(stepgen.speed_target)
+            max_acceleration = Signal.like(stepgen.max_acceleration)
+            standalone.sync += [
+                stepgen.speed_target.eq(speed_target),
+                stepgen.max_acceleration.eq(max_acceleration),
+            ]
+            # Migen derives port names from the attribute path of the
+            # signals, which for the signals created inside the module and
+            # its pin-out routine yields auto-numbered names like
+            # `stepgenmodule_1`. Override them with stable names, so the
+            # ports of the generated Verilog can be bound by name (e.g. by
+            # the Verilator test-bench).
+            ports = {
+                name: getattr(stepgen, name) for name in port_names
+            }
+            ports["speed_target"] = speed_target
+            ports["max_acceleration"] = max_acceleration
+            for name, signal in ports.items():
+                signal.name_override = name
+            ios = set(stepgen.ios) | set(ports.values())
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(path, "w") as file:
+                file.write(str(verilog.convert(standalone, ios, "stepgen")))
+        return path
 
     @classmethod
     def add_mmio_config_registers(cls, mmio, config: List[StepgenConfig]):
@@ -511,10 +835,38 @@ class StepgenModule(Module, AutoDoc):
         while (soc.clock_frequency / (1 << shift) > 400e3):
             shift += 1
 
+        # The MMIO registers are looked up once per stepgen; the f-string
+        # formatting and attribute lookups otherwise repeat for every
+        # connection made below
+        mmio = soc.MMIO_inst
+
+        # The apply-time is shared by all stepgens, so the 64-bit comparison
+        # against the wall clock is computed once and broadcast, instead of
+        # repeating the comparator per stepgen. The event fires once per
+        # written apply-time (the latch re-arms when the driver writes the
+        # register): the targets are latched into the stepgens on a single
+        # cycle instead of being re-applied on every clock the comparison
+        # holds.
+        apply_now = Signal()
+        apply_fired = Signal()
+        soc.comb += apply_now.eq(
+            (mmio.wall_clock.status >= mmio.stepgen_apply_time.storage)
+            & ~apply_fired
+        )
+        soc.sync += If(
+            mmio.stepgen_apply_time.re,
+            apply_fired.eq(0)
+        ).Elif(
+            apply_now,
+            apply_fired.eq(1)
+        )
+
         for index, stepgen_config in enumerate(config):
             soc.platform.add_extension([
-                ("stepgen", index,
-                    *stepgen_config.pins.convert_to_signal()
+                _build_pin_extension(
+                    index,
+                    stepgen_config.pins.json(),
+                    type(stepgen_config.pins)
                 )
             ])
             # Create the stepgen and add to the system
@@ -522,76 +874,294 @@ class StepgenModule(Module, AutoDoc):
                 pads=soc.platform.request('stepgen', index),
                 pick_off=(32, 32 + shift, 32 + shift + 8),
                 soft_stop=stepgen_config.soft_stop,
-                create_routine=stepgen_config.pins.create_routine
+                create_routine=stepgen_config.pins.create_routine,
+                prune_bits=stepgen_config.prune_bits
             )
             soc.submodules += stepgen
-            # Connect all the memory
-            soc.sync += [ # Aangepast
-                # Data from MMIO to stepgen
-                stepgen.reset.eq(soc.MMIO_inst.reset.storage),
-                stepgen.enable.eq(~watchdog.has_bitten),
-                stepgen.steplen.eq(soc.MMIO_inst.stepgen_stepdata.fields.steplen),
-                stepgen.dir_hold_time.eq(soc.MMIO_inst.stepgen_stepdata.fields.dir_hold_time),
-                stepgen.dir_setup_time.eq(soc.MMIO_inst.stepgen_stepdata.fields.dir_setup_time),
-            ]
-            soc.sync += [
-                # Position and feedback from stepgen to MMIO
-                getattr(soc.MMIO_inst, f'stepgen_{index}_position').status.eq(stepgen.position[(stepgen.pick_off_vel - stepgen.pick_off_pos):]),
-                getattr(soc.MMIO_inst, f'stepgen_{index}_speed').status.eq(stepgen.speed[(stepgen.pick_off_acc - stepgen.pick_off_vel):])
-            ]
-            # Add speed target and the max acceleration in the protected sync
-            soc.sync += [
-                If(
-                    soc.MMIO_inst.wall_clock.status >= soc.MMIO_inst.stepgen_apply_time.storage,
-                    stepgen.speed_target.eq(Cat(Constant(0, bits_sign=(stepgen.pick_off_acc - stepgen.pick_off_vel)), getattr(soc.MMIO_inst, f'stepgen_{index}_speed_target').storage)),
-                    stepgen.max_acceleration.eq(getattr(soc.MMIO_inst, f'stepgen_{index}_max_acceleration').storage),
-                )
-            ]
-            # Add reset logic to stop the motion after reboot of LinuxCNC
-            soc.sync += [
-                soc.MMIO_inst.stepgen_apply_time.we.eq(0),
-                If(
-                    soc.MMIO_inst.reset.storage,
-                    soc.MMIO_inst.stepgen_apply_time.dat_w.eq(0x80000000),
-                    soc.MMIO_inst.stepgen_apply_time.we.eq(1)
+            # Connect the stepgen to its MMIO registers
+            cls._connect_stepgen(soc, mmio, watchdog, stepgen, index, apply_now)
+
+        # Add reset logic to stop the motion after reboot of LinuxCNC. The
+        # statements are index-independent, so they are emitted once instead
+        # of once per stepgen.
+        soc.sync += [
+            mmio.stepgen_apply_time.we.eq(0),
+            If(
+                mmio.reset.storage,
+                mmio.stepgen_apply_time.dat_w.eq(0x80000000),
+                mmio.stepgen_apply_time.we.eq(1)
+            )
+        ]
+
+    @classmethod
+    def _connect_stepgen(cls, soc, mmio, watchdog, stepgen, index, apply_now):
+        """
+        Connects a single stepgen to its MMIO registers. Split from
+        `create_from_config` so the per-stepgen plumbing is built in one
+        place and the loop only contains what actually differs per stepgen.
+        """
+        # Look up the CSRs of this stepgen once
+        position = getattr(mmio, f'stepgen_{index}_position')
+        speed = getattr(mmio, f'stepgen_{index}_speed')
+        speed_target = getattr(mmio, f'stepgen_{index}_speed_target')
+        max_acceleration = getattr(mmio, f'stepgen_{index}_max_acceleration')
+        # Connect all the memory
+        soc.sync += [ # Aangepast
+            # Data from MMIO to stepgen
+            stepgen.reset.eq(mmio.reset.storage),
+            stepgen.enable.eq(~watchdog.has_bitten),
+            stepgen.steplen.eq(mmio.stepgen_stepdata.fields.steplen),
+            stepgen.dir_hold_time.eq(mmio.stepgen_stepdata.fields.dir_hold_time),
+            stepgen.dir_setup_time.eq(mmio.stepgen_stepdata.fields.dir_setup_time),
+        ]
+        soc.sync += [
+            # Position and feedback from stepgen to MMIO
+            position.status.eq(stepgen.position[(stepgen.pick_off_step - stepgen.pick_off_pos):]),
+            speed.status.eq(stepgen.speed[stepgen.d_av:])
+        ]
+        # Add speed target and the max acceleration in the protected sync
+        soc.sync += [
+            If(
+                apply_now,
+                stepgen.speed_target.eq(Cat(Constant(0, bits_sign=stepgen.d_av), speed_target.storage)),
+                stepgen.max_acceleration.eq(max_acceleration.storage),
+            )
+        ]
+
+
+class StepgenModuleBresenham(StepgenModule):
+    """
+    Variant of `StepgenModule` which generates the steps with a
+    Bresenham-style integer DDA instead of the wide position accumulator.
+
+    Instead of adding the full-width speed to the 64-bit position every
+    clock-cycle and watching the pick-off bit toggle, this variant
+    accumulates the absolute speed in a short error term and toggles the
+    pick-off bit of the position (by adding or subtracting exactly one
+    half-step) every time the error reaches one half step-period. The
+    per-cycle adder is `pick_off_vel + 1` bits wide instead of
+    `position_width` bits, which relaxes the carry-chain timing on small
+    FPGA's.
+
+    NOTE: the reported position advances in whole half-steps; the fraction
+    below the velocity pick-off which `StepgenModule` tracks is kept in the
+    error term and not visible in the position feedback.
+    """
+
+    def _add_position_update(self, sync, soft_stop) -> None:
+        # The registered sign bit of the speed indicates the direction (set
+        # means moving in positive direction, see `speed_reset_val`)
+        speed_sign = self.speed_sign
+        # Signed velocity, i.e. the speed with its offset removed
+        velocity = Signal((self.speed_width - self.prune_bits + 1, True))
+        self.comb += velocity.eq(
+            self.speed[self.d_av + self.prune_bits:]
+            - (1 << (self.speed_width - 1 - self.prune_bits))
+        )
+        abs_velocity = Signal(self.speed_width - self.prune_bits)
+        self.comb += abs_velocity.eq(
+            Mux(speed_sign, velocity, -velocity)
+        )
+        # The error term accumulates the absolute velocity. As soon as it
+        # reaches one half step-period the position is moved a whole
+        # half-step, which toggles the pick-off bit and thus produces the
+        # step in `create_routine`.
+        half_step = 1 << self.pick_off_step
+        self.error = Signal(self.pick_off_step)
+        total = Signal(self.pick_off_step + 1)
+        self.comb += total.eq(self.error + abs_velocity)
+        if soft_stop:
+            # Only check we are not waiting for the dir_setup. When the system
+            # is disabled, the speed is set to 0 (with respect to acceleration
+            # limits) and the machine will be stopped when disabled.
+            gate = ~self.reset & ~self.wait
+        else:
+            # Check whether the system is enabled and we are not waiting for
+            # the dir_setup
+            gate = ~self.reset & self.enable & ~self.wait
+        sync += If(
+            gate,
+            If(
+                total >= half_step,
+                self.error.eq(total - half_step),
+                self.position.eq(
+                    self.position + Mux(speed_sign, half_step, -half_step)
                 )
-            ]
+            ).Else(
+                self.error.eq(total)
+            )
+        )
+        sync += If(
+            self.reset,
+            self.error.eq(0),
+            self.position.eq(0)
+        )
 
 
 if __name__ == "__main__":
+    import os
+    import shutil
+    import subprocess
+    import sys
+
+    import numpy as np
     from migen import *
-    from migen.fhdl import *
+    from migen.fhdl import verilog
 
-    def test_stepgen(stepgen):
+    # Number of clock-cycles to simulate. Shared between the Migen and the
+    # Verilator back-end, so both produce the same waveform.
+    NUMBER_OF_CYCLES = 100000
+
+    def test_stepgen(stepgen, trace_file="stepgen_trace.csv"):
         i = 0
         # Setup the stepgen
         yield(stepgen.enable.eq(1))
         # yield(stepgen.speed_target.eq(0x80000000 - int(2**28 / 128)))
-        yield(stepgen.speed.eq(0x8000_0000_0000 + (0 << 16)))
-        yield(stepgen.speed_test.eq(0x8000_0000 + (0x53E)))
+        yield(stepgen.speed_target.eq(0x8000_0000 + (0x53E)))
         yield(stepgen.max_acceleration.eq(0x36F))
         yield(stepgen.steplen.eq(16))
         yield(stepgen.dir_hold_time.eq(16))
         yield(stepgen.dir_setup_time.eq(32))
         speed_prev=0
+        # A print per cycle would make the whole simulation I/O-bound on
+        # flushing stdout; the signals are recorded in a pre-allocated array
+        # instead and written out once after the run.
+        verbose = "--verbose" in sys.argv
+        trace = np.empty((NUMBER_OF_CYCLES + 1, 5), dtype=np.int64)
+
+        # Additional stimuli as a `(cycle, raw speed_target)` table, walked
+        # with a single index instead of comparing the cycle number against
+        # every event in the loop.
+        stimuli = (
+            # (390, 0x80000000 + int(2**28 / 128)),
+        )
+        stimulus = 0
 
         while(1):
-            # if i == 390:
-            #     yield(stepgen.speed_target.eq(0x80000000 + int(2**28 / 128)))
+            while stimulus < len(stimuli) and stimuli[stimulus][0] == i:
+                yield(stepgen.speed_target.eq(stimuli[stimulus][1]))
+                stimulus += 1
             position = (yield stepgen.position)
             step = (yield stepgen.step)
             dir = (yield stepgen.dir)
-            speed = (yield stepgen.speed_reported - 0x8000_0000)
-            counter = (yield stepgen.dir_hold_counter.counter)
-            if speed != speed_prev:
-                print("speed = %d, position = %d @step %d @dir %d @dir_counter %d @clk %d"%(speed, position, step, dir, counter, i))
+            speed = (yield stepgen.speed) - 0x8000_0000
+            counter = (yield stepgen.steplen_counter)
+            trace[i] = (speed, position, step, dir, counter)
+            if verbose and speed != speed_prev:
+                print("speed = %d, position = %d @step %d @dir %d @counter %d @clk %d"%(speed, position, step, dir, counter, i))
                 speed_prev = speed
             yield
             i+=1
-            if i > 100000:
+            if i > NUMBER_OF_CYCLES:
                 break
 
-    stepgen = StepgenModule(pads=None, pick_off=32, soft_stop=True)
-    print("\nRunning Sim...\n")
-    # print(verilog.convert(stepgen, stepgen.ios, "pre_scaler"))
-    run_simulation(stepgen, test_stepgen(stepgen))
\ No newline at end of file
+        np.savetxt(
+            trace_file,
+            trace,
+            fmt="%d",
+            header="speed position step dir steplen_counter"
+        )
+        print(f"Wrote simulation trace to `{trace_file}`")
+
+        # Validate the recorded trace with the compiled post-processor
+        # instead of per-cycle assertions in this (interpreted) generator
+        from litexcnc.firmware.stepgen_model import check_trace
+        errors = check_trace(trace, 16)
+        if errors:
+            raise AssertionError(
+                f"Trace violates the stepgen invariants in {errors} cycles."
+            )
+        print("Trace checked, no invariant violations.")
+
+    # The C++ test-bench which replays the same stimulus as `test_stepgen`.
+    # The Migen Python simulator interprets every signal update per clock;
+    # Verilator compiles the design to C++, which is orders of magnitude
+    # faster for long waveforms.
+    VERILATOR_TESTBENCH = """
+#include "Vstepgen.h"
+#include "verilated.h"
+#include <cstdio>
+
+int main(int argc, char** argv) {
+    Verilated::commandArgs(argc, argv);
+    Vstepgen* stepgen = new Vstepgen;
+    // Reset the design
+    stepgen->sys_rst = 1;
+    stepgen->sys_clk = 0; stepgen->eval();
+    stepgen->sys_clk = 1; stepgen->eval();
+    stepgen->sys_rst = 0;
+    // Setup the stepgen (mirrors `test_stepgen`)
+    stepgen->enable = 1;
+    stepgen->speed_target = 0x80000000ULL + 0x53E;
+    stepgen->max_acceleration = 0x36F;
+    stepgen->steplen = 16;
+    stepgen->dir_hold_time = 16;
+    stepgen->dir_setup_time = 32;
+    long long speed_prev = 0;
+    for (long long i = 0; i <= %(cycles)dLL; ++i) {
+        stepgen->sys_clk = 0; stepgen->eval();
+        stepgen->sys_clk = 1; stepgen->eval();
+        long long speed = (long long) stepgen->speed - 0x80000000LL;
+        if (speed != speed_prev) {
+            printf("speed = %%lld, position = %%lld @step %%d @dir %%d @clk %%lld\\n",
+                speed, (long long) stepgen->position, (int) stepgen->step,
+                (int) stepgen->dir, i);
+            speed_prev = speed;
+        }
+    }
+    stepgen->final();
+    delete stepgen;
+    return 0;
+}
+"""
+
+    def run_verilator(pins, build_dir="build/stepgen_sim"):
+        """
+        Converts the stepgen to Verilog (re-using the cached conversion when
+        available), compiles it with Verilator and runs the compiled
+        simulation with the same stimulus as `test_stepgen`.
+        """
+        os.makedirs(build_dir, exist_ok=True)
+        shutil.copy(
+            StepgenModule.generate_verilog(pins, pick_off=32, soft_stop=True),
+            os.path.join(build_dir, "stepgen.v")
+        )
+        with open(os.path.join(build_dir, "sim_main.cpp"), "w") as file:
+            file.write(VERILATOR_TESTBENCH % {"cycles": NUMBER_OF_CYCLES})
+        subprocess.check_call(
+            [
+                "verilator",
+                # Migen-generated Verilog trips a number of width warnings,
+                # which Verilator treats as fatal by default
+                "-Wno-fatal",
+                "--cc", "--build", "-O3", "--exe",
+                "--top-module", "stepgen",
+                "stepgen.v", "sim_main.cpp"
+            ],
+            cwd=build_dir
+        )
+        subprocess.check_call([os.path.join("obj_dir", "Vstepgen")], cwd=build_dir)
+
+    pins = StepGenPinoutStepDirConfig(
+        stepgen_type='step_dir',
+        step_pin='j1:0',
+        dir_pin='j1:1'
+    )
+    if shutil.which("verilator") is not None and not (
+            "--migen" in sys.argv or "--jit" in sys.argv):
+        print("\nRunning Sim (Verilator)...\n")
+        run_verilator(pins)
+    else:
+        stepgen = StepgenModule(
+            pads=None,
+            pick_off=32,
+            soft_stop=True,
+            create_routine=pins.create_routine
+        )
+        if "--jit" in sys.argv:
+            from litexcnc.firmware.sim import run_simulation_jit
+            print("\nRunning Sim (JIT)...\n")
+            run_simulation_jit(stepgen, test_stepgen(stepgen))
+        else:
+            print("\nRunning Sim (Migen)...\n")
+            run_simulation(stepgen, test_stepgen(stepgen))
\ No newline at end of file
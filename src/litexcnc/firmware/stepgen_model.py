@@ -0,0 +1,245 @@
+# Software model of the stepgen.
+#
+# This module implements the state machine of `StepgenModule` (see
+# `stepgen.py`) in plain integer arithmetic, so long trajectories can be
+# previewed without simulating the HDL. The model advances all state in a
+# single tight loop which Numba compiles to native code when it is installed
+# (50-200x faster than the interpreted loop); without Numba the same function
+# runs as regular Python.
+#
+# NOTE: the model mirrors the hardware with a single pick-off, which is
+# equivalent to `StepgenModule(pick_off=n)`. The stepgen is modelled as
+# enabled and out of reset for the whole run.
+import numpy as np
+
+try:
+    from numba import njit, prange
+    _HAS_NUMBA = True
+except ImportError:
+    # Numba is optional; without it the model runs as plain Python (or as
+    # the ahead-of-time compiled kernel, see the bottom of this file)
+    def njit(*args, **kwargs):
+        def decorator(function):
+            return function
+        return decorator
+    prange = range
+    _HAS_NUMBA = False
+
+
+@njit(cache=True)
+def simulate(
+        n_cycles,
+        speed_target,
+        steplen,
+        dir_hold_time,
+        dir_setup_time,
+        max_acceleration,
+        pick_off,
+        out_position,
+        out_step,
+        out_dir
+    ):
+    """
+    Advances the stepgen model `n_cycles` clock-cycles from reset and stores
+    the position, step and dir signals per cycle in the pre-allocated output
+    arrays (`np.int64`, `np.uint8` and `np.uint8` of at least `n_cycles`
+    elements).
+
+    The `speed_target` is the raw register value, i.e. including the
+    0x8000_0000 offset which is treated as zero speed, identical to the
+    value written to the `speed_target` signal of `StepgenModule`.
+    """
+    # Reset values, see `StepgenModule.__init__`
+    speed = 1 << 31
+    position = 0
+    steplen_counter = 0
+    dir_hold_counter = 0
+    dir_setup_counter = 0
+    hold_dds = 0
+    wait = 0
+    step_prev = 0
+    step = 0
+    dir = 1
+
+    for cycle in range(n_cycles):
+        out_position[cycle] = position
+        out_step[cycle] = step
+        out_dir[cycle] = dir
+
+        # All assignments below are synchronous: the right-hand sides read
+        # the state of the current cycle, the results become the state of
+        # the next cycle (matching Migen's `sync` semantics).
+        next_speed = speed
+        next_position = position
+        next_steplen_counter = steplen_counter
+        next_dir_hold_counter = dir_hold_counter
+        next_dir_setup_counter = dir_setup_counter
+        next_hold_dds = hold_dds
+        next_wait = wait
+        next_step_prev = step_prev
+        next_dir = dir
+
+        # Determine the next speed, while taking into account acceleration
+        # limits if applied
+        if not wait:
+            if max_acceleration == 0:
+                next_speed = speed_target
+            elif speed_target > (speed + max_acceleration):
+                next_speed = speed + max_acceleration
+            elif speed_target < (speed - max_acceleration):
+                next_speed = speed - max_acceleration
+            else:
+                next_speed = speed_target
+
+        # Update the position
+        if not wait:
+            next_position = position + speed - 0x8000_0000
+
+        # Translate the position to steps by looking at the pick-off bit
+        position_bit = (position >> pick_off) & 1
+        if position_bit != step_prev:
+            if not hold_dds:
+                next_step_prev = position_bit
+                next_steplen_counter = steplen
+                next_dir_hold_counter = steplen + dir_hold_time
+                next_dir_setup_counter = (
+                    steplen + dir_hold_time + dir_setup_time
+                )
+                next_wait = 0
+            else:
+                next_wait = 1
+
+        # Reset the DDS flag when dir_setup_counter has lapsed
+        if dir_setup_counter == 0:
+            next_hold_dds = 0
+
+        # Convert the parameters to output of step and dir
+        step = 1 if steplen_counter > 0 else 0
+        speed_sign = (speed >> 31) & 1
+        if dir != speed_sign:
+            next_hold_dds = 1
+            if dir_setup_counter == 0:
+                next_dir_setup_counter = dir_setup_time
+            if dir_hold_counter == 0:
+                next_dir = speed_sign
+
+        # The counters count down as soon as they are larger than 0. The
+        # decrement is modelled last: the counters used to be submodules,
+        # whose synchronous statements Migen appends after the ones of the
+        # stepgen itself, so on a simultaneous reload and decrement the
+        # decrement wins (the HDL keeps this ordering with its inlined
+        # counters).
+        if steplen_counter > 0:
+            next_steplen_counter = steplen_counter - 1
+        if dir_hold_counter > 0:
+            next_dir_hold_counter = dir_hold_counter - 1
+        if dir_setup_counter > 0:
+            next_dir_setup_counter = dir_setup_counter - 1
+
+        speed = next_speed
+        position = next_position
+        steplen_counter = next_steplen_counter
+        dir_hold_counter = next_dir_hold_counter
+        dir_setup_counter = next_dir_setup_counter
+        hold_dds = next_hold_dds
+        wait = next_wait
+        step_prev = next_step_prev
+        dir = next_dir
+
+
+@njit(parallel=True, cache=True)
+def simulate_axes(
+        n_cycles,
+        speed_target,
+        steplen,
+        dir_hold_time,
+        dir_setup_time,
+        max_acceleration,
+        pick_off,
+        out_position,
+        out_step,
+        out_dir
+    ):
+    """
+    Advances one stepgen model per axis in parallel. The parameters are
+    arrays with one element per axis (structure-of-arrays layout) and the
+    output arrays have one row per axis (`shape = (n_axes, n_cycles)`), so a
+    whole multi-axis board is previewed with a single compiled call instead
+    of an interpreted per-axis loop.
+    """
+    for axis in prange(speed_target.shape[0]):
+        simulate(
+            n_cycles,
+            speed_target[axis],
+            steplen[axis],
+            dir_hold_time[axis],
+            dir_setup_time[axis],
+            max_acceleration[axis],
+            pick_off[axis],
+            out_position[axis],
+            out_step[axis],
+            out_dir[axis]
+        )
+
+
+@njit(parallel=True, cache=True)
+def check_trace(trace, steplen):
+    """
+    Validates a trace recorded by the simulation harness of `stepgen.py`
+    (rows of `(speed, position, step, dir, steplen_counter)`) and returns the
+    number of cycles which violate an invariant of the stepgen:
+
+    * the step output is high exactly one cycle after the steplen counter
+      is running (`0 < steplen_counter <= steplen`);
+    * the position moves by exactly the speed, or not at all (the update is
+      paused while a direction change is pending).
+
+    The cycles are checked independently, so the check runs in parallel over
+    the whole trace: validating millions of cycles is bound by the compiled
+    integer compares instead of per-cycle Python assertions.
+
+    NOTE: the position/speed invariant only holds when the velocity and
+    acceleration pick-off coincide (`StepgenModule(pick_off=n)`), like the
+    rest of this model.
+    """
+    errors = 0
+    for cycle in prange(trace.shape[0] - 1):
+        speed = trace[cycle, 0]
+        position = trace[cycle, 1]
+        counter = trace[cycle, 4]
+        expected_step = 1 if 0 < counter <= steplen else 0
+        if trace[cycle + 1, 2] != expected_step:
+            errors += 1
+        delta = trace[cycle + 1, 1] - position
+        if delta != speed and delta != 0:
+            errors += 1
+    return errors
+
+
+if not _HAS_NUMBA:
+    try:
+        # Use the ahead-of-time compiled kernel when the JIT is not
+        # available. The module is built with:
+        #   python -m litexcnc.firmware.stepgen_model
+        from .stepgen_model_aot import simulate  # noqa: F811
+    except ImportError:
+        pass
+
+
+if __name__ == "__main__":
+    # Builds the ahead-of-time compiled variant of the kernel, so
+    # installations without Numba still get compiled code and installations
+    # with Numba can skip the JIT warm-up (`cache=True` already hides it
+    # after the first run).
+    import os
+    from numba.pycc import CC
+
+    cc = CC('stepgen_model_aot')
+    cc.output_dir = os.path.dirname(os.path.abspath(__file__))
+    cc.export(
+        'simulate',
+        'void(int64, int64, int64, int64, int64, int64, int64, '
+        'int64[:], uint8[:], uint8[:])'
+    )(simulate.py_func if hasattr(simulate, 'py_func') else simulate)
+    cc.compile()
+    print(f"Compiled `stepgen_model_aot` to {cc.output_dir}")